@@ -0,0 +1,142 @@
+"""LSP base-protocol framing shared by the Python LSP tests.
+
+Kept free of dynamic tricks and fully annotated so it can be compiled
+with mypyc (`mypyc tests/lsp/_frame.py`); the plain module is used when
+no compiled build is present.
+"""
+
+import json
+import os
+import re
+import sys
+from functools import lru_cache
+from typing import Any, Optional, Union
+
+# Both branches define the same typed signatures, as mypyc requires of conditional functions
+try:
+    import orjson  # type: ignore[import-not-found,unused-ignore]
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: Union[bytes, bytearray, str]) -> Any:
+        return orjson.loads(data)
+except ImportError:  # orjson is optional; the stdlib codec is only slower
+    def dumps(obj: Any) -> bytes:
+        # Compact and left as UTF-8, the same bytes orjson would produce
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def loads(data: Union[bytes, bytearray, str]) -> Any:
+        return json.loads(data)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+# Linux F_SETPIPE_SZ; fcntl only exposes the name from Python 3.10
+_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031) if sys.platform.startswith("linux") else None
+
+
+# What grow_pipe asks for, and so the most a single pipe read can return
+PIPE_SIZE = 1 << 20
+
+
+def grow_pipe(fd: int, size: int = PIPE_SIZE) -> None:
+    """Best-effort enlarge a pipe's kernel buffer from the 64 KiB default.
+
+    Unprivileged processes are capped by /proc/sys/fs/pipe-max-size
+    (1 MiB by default); a refused resize leaves the pipe as it was.
+    """
+    if _SETPIPE_SZ is None:
+        return
+    try:
+        fcntl.fcntl(fd, _SETPIPE_SZ, size)
+    except OSError:
+        pass
+
+
+_CONTENT_LENGTH = b"Content-Length: "
+_HEADER = _CONTENT_LENGTH + b"%d\r\n\r\n"
+
+
+def header(body: bytes) -> bytes:
+    return _HEADER % len(body)
+
+
+def frame(body: bytes) -> bytes:
+    """Prefix an encoded JSON body with its Content-Length header"""
+    return header(body) + body
+
+
+def content_length(buf: bytearray, end: int) -> int:
+    """Content-Length of the header block buf[:end], parsed in place without decoding"""
+    if buf.startswith(_CONTENT_LENGTH):  # the only header zen-lsp ever sends
+        line_end = buf.find(b"\r\n")
+        return int(buf[len(_CONTENT_LENGTH):line_end])
+    at = buf.find(b"Content-Length:", 0, end)
+    if at < 0:
+        raise ValueError(f"LSP header without Content-Length: {bytes(buf[:end])!r}")
+    return int(buf[at + 15:buf.find(b"\r\n", at)])
+
+
+# The leading envelope of a response, in the field order serde writes it
+_RESPONSE_HEAD = re.compile(rb'\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"id"\s*:\s*(\d+)\s*,\s*"(?:result|error)"')
+
+
+def response_id(body: bytes) -> Optional[int]:
+    """Id of a response body found by scanning its first bytes, without parsing the JSON.
+
+    None means "not recognised", not "not a response": the caller must fall
+    back to a full parse.
+    """
+    m = _RESPONSE_HEAD.match(body)
+    return int(m.group(1)) if m else None
+
+
+_NOTIFICATION_HEAD = re.compile(rb'\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"method"\s*:\s*"([^"\\]*)"')
+
+
+def notification_method(body: bytes) -> Optional[str]:
+    """Method of a notification body found the same way; None means "not recognised" """
+    m = _NOTIFICATION_HEAD.match(body)
+    return m.group(1).decode() if m else None
+
+
+def write_all(fd: int, data: Union[bytes, bytearray]) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+@lru_cache(maxsize=None)
+def _envelope(method: str) -> bytes:
+    """The '"method":...,"params":' part of a message, encoded once per method"""
+    return b'"method":%s,"params":' % dumps(method)
+
+
+def encode(method: str, params: Any, msg_id: Optional[int] = None) -> bytes:
+    """Encode a JSON-RPC message body; params may already be encoded JSON bytes"""
+    head = b'{"jsonrpc":"2.0",' if msg_id is None else b'{"jsonrpc":"2.0","id":%d,' % msg_id
+    if not isinstance(params, bytes):
+        params = dumps(params)
+    return b"%s%s%s}" % (head, _envelope(method), params)
+
+
+def write_message(fd: int, method: str, params: Any, msg_id: Optional[int] = None) -> None:
+    """Encode and write one JSON-RPC request (or notification when msg_id is None)"""
+    body = encode(method, params, msg_id)
+    head = header(body)
+    if not hasattr(os, "writev"):  # Windows
+        write_all(fd, head + body)
+        return
+    # Header and body go to the kernel as two iovecs: no concatenated copy
+    sent = os.writev(fd, (head, body))
+    if sent < len(head) + len(body):
+        write_all(fd, (head + body)[sent:])
+
+
+# Lifecycle messages never change, so they are encoded once at import
+EMPTY = b"{}"
+INITIALIZED = frame(encode("initialized", EMPTY))
+EXIT = frame(encode("exit", EMPTY))
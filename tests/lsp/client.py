@@ -1,59 +1,632 @@
 """LSP JSON-RPC Client"""
 
-import subprocess
-import json
+import atexit
+import itertools
 import os
+import selectors
+import subprocess
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urlparse
+
+from _frame import EMPTY, EXIT, INITIALIZED, PIPE_SIZE, content_length, dumps, encode, frame, grow_pipe, loads, notification_method, response_id, write_all, write_message
+
+# Resolved from this file, so tests find the build and workspace from any working directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Resolved once: both are fixed for the life of the test process
+PID = os.getpid()
+ROOT_URI = Path(REPO_ROOT).as_uri()
+_INIT_PARAMS = dumps({"processId": PID, "rootUri": ROOT_URI, "capabilities": {}})
+
+# Honours CARGO_TARGET_DIR, so a target dir persisted across CI runs is found too.
+# A relative one is resolved against REPO_ROOT, where build() runs cargo
+TARGET_DIR = os.path.join(REPO_ROOT, os.environ.get("CARGO_TARGET_DIR") or "target")
+
+# ZEN_LSP overrides; otherwise the release build is preferred. Looked up once, not per client
+LSP_PATH = os.environ.get("ZEN_LSP") or next(
+    (p for p in (os.path.join(TARGET_DIR, build, "zen-lsp") for build in ("release", "debug")) if os.path.exists(p)),
+    None)
+
+# Longest a caller may wait on the server before the test fails instead of hanging,
+# and how long shutdown gives it to exit before killing it. Both are upper bounds,
+# never sleeps, so CI can raise them for slow machines without slowing fast runs.
+READ_TIMEOUT = float(os.environ.get("ZEN_LSP_TIMEOUT", "10"))
+EXIT_TIMEOUT = float(os.environ.get("ZEN_LSP_EXIT_TIMEOUT", "1"))
+
+# Server stderr goes here when set; otherwise its last STDERR_TAIL bytes are
+# kept in memory for stderr_tail(). It is never left on an unread pipe, which
+# would block the server once the pipe fills.
+STDERR_LOG = os.environ.get("ZEN_LSP_STDERR")
+STDERR_TAIL = 64 * 1024
+
+# Set ZEN_LSP_DEBUG to echo every message to stderr; off by default, where it costs one check
+DEBUG = bool(os.environ.get("ZEN_LSP_DEBUG"))
+
+# Parameterless notifications that only signal "something changed": one pending copy is as good as many
+_SIGNALS = frozenset({"workspace/semanticTokens/refresh"})
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@lru_cache(maxsize=None)
+def uri_of(path: str) -> str:
+    """file:// URI of an absolute path, percent-encoded, computed once per path"""
+    return Path(path).as_uri()
+
+
+def path_of(uri: str) -> str:
+    """Filesystem path of a file:// URI, decoding any percent-escapes"""
+    from urllib.request import url2pathname  # pulls in http.client and email; most runs never call this
+    return url2pathname(urlparse(uri).path)
+
+
+@lru_cache(maxsize=None)
+def document(path: str) -> tuple:
+    """(uri, text) of a file on disk, read in one call and decoded once per process"""
+    path = os.path.abspath(path)
+    with open(path, "rb") as f:
+        return uri_of(path), f.read().decode()
+
+
+def fixture(name: str) -> tuple:
+    """(uri, text) of a shared document under tests/lsp/fixtures"""
+    return document(os.path.join(FIXTURES, name))
+
+
+def _trace(arrow: str, data: bytes):
+    sys.stderr.write(f"{arrow} {data.decode(errors='replace')}\n")
+
+
+def needs_build() -> bool:
+    """Whether the server that would run (LSP_PATH) is missing or older than any
+    Rust source or Cargo manifest.
+
+    Comparing mtimes is far cheaper than letting cargo walk the workspace
+    to find out there is nothing to do.
+    """
+    built = _mtime(Path(LSP_PATH)) if LSP_PATH else None
+    if built is None:
+        return True
+    root = Path(REPO_ROOT)
+    inputs = itertools.chain((root / "Cargo.toml", root / "Cargo.lock"), (root / "src").rglob("*.rs"))
+    return any((_mtime(p) or 0.0) > built for p in inputs)
+
+
+def _mtime(path: Path):
+    """mtime of path, or None if it does not exist (Cargo.lock is untracked, so may not)"""
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def build() -> str:
+    """Build the release server once and point LSP_PATH at it; returns the path.
+
+    --offline skips Cargo's registry checks, which an already-fetched
+    workspace never needs. The binary is then spawned directly, never
+    through cargo run.
+    """
+    global LSP_PATH
+    subprocess.run(["cargo", "build", "--release", "--offline", "--bin", "zen-lsp"], cwd=REPO_ROOT, check=True)
+    LSP_PATH = os.path.join(TARGET_DIR, "release", "zen-lsp")
+    return LSP_PATH
+
+
+_scratch_dir = None
+
+
+def scratch(name: str, content: str) -> tuple:
+    """Write a throwaway document and return its (uri, text).
+
+    Files go to one temp dir per process, outside the workspace root, so the
+    server's workspace indexing never picks them up; it is removed at exit.
+    """
+    global _scratch_dir
+    if _scratch_dir is None:
+        import shutil  # only needed by tests that write scratch files
+        import tempfile
+        _scratch_dir = tempfile.mkdtemp(prefix="zen-lsp-")
+        atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+    path = os.path.join(_scratch_dir, name)
+    with open(path, "wb") as f:
+        f.write(content.encode())
+    return uri_of(path), content
+
+
+def make_fixture(n_vars: int) -> str:
+    """Synthetic document with n_vars bindings, for measuring how features scale with size"""
+    body = "".join(f"    x{i} := {i}\n" for i in range(n_vars))
+    return f"main = () i32 {{\n{body}    return 0\n}}\n"
+
+
+@lru_cache(maxsize=32)
+def _did_open_params(uri: str, content: str) -> bytes:
+    """didOpen params encoded once per document, so reopening skips the JSON pass"""
+    return dumps({"textDocument": {"uri": uri, "languageId": "zen", "version": 1, "text": content}})
+
+
+def _offset(text: str, line: int, char: int) -> int:
+    """Index of an LSP position in text, counting characters as zen-lsp does.
+
+    Like the server's position_to_byte_offset, a position past the end of
+    its line, or past the last line, is the end of the document.
+    """
+    at = 0
+    for _ in range(line):
+        at = text.find("\n", at) + 1
+        if not at:
+            return len(text)
+    end = text.find("\n", at)
+    return at + char if at + char <= (len(text) if end < 0 else end) else len(text)
+
+
+class _Multiplexer:
+    """A single selector thread that reads stdout (and stderr) for every live LSPClient.
+
+    Running several servers costs one kernel wait and one Python thread,
+    not a blocked reader thread per server.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Wakes select() so fds registered after it started are seen on every platform
+        self._wake_r, self._wake_w = os.pipe()
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+    def register(self, fd: int, client):
+        """Feed fd to client, or keep its tail in client if that is a bytearray (stderr)"""
+        with self._lock:
+            self._selector.register(fd, selectors.EVENT_READ, client)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        os.write(self._wake_w, b"\0")
+
+    def unregister(self, fd: int):
+        with self._lock:
+            try:
+                self._selector.unregister(fd)
+            except KeyError:
+                pass
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                data = key.data
+                try:
+                    with self._lock:  # so shutdown cannot close this fd between the check and the read
+                        if self._selector.get_map().get(key.fd) is not key:
+                            continue  # unregistered, and perhaps closed, since select() returned
+                        chunk = os.read(key.fd, _read_size(data))
+                    if data is None:  # the wake pipe
+                        continue
+                    if isinstance(data, bytearray):  # a server's stderr: keep only the tail
+                        if not chunk:
+                            self.unregister(key.fd)
+                        data += chunk
+                        del data[:-STDERR_TAIL]
+                        continue
+                    if not chunk:
+                        raise RuntimeError(_exit_message(data.proc))
+                    data._feed(chunk)
+                except Exception as e:  # EOF, a bad frame or a dead fd: drop the fd, never the thread
+                    if data is not None:
+                        self.unregister(key.fd)
+                    if isinstance(data, LSPClient):
+                        data._fail(e)
+
+
+def _read_size(data) -> int:
+    if isinstance(data, LSPClient):
+        # Ask for the rest of a large body at once, but never more than the pipe can hold:
+        # os.read allocates the full size asked for before the kernel fills it
+        return min(max(65536, data._need - len(data._rx)), PIPE_SIZE)
+    return 65536 if data is not None else 4096
+
+
+def _exit_message(proc) -> str:
+    """Why stdout hit EOF; waits only briefly, since this runs on the shared reader thread"""
+    try:
+        return f"zen-lsp exited with code {proc.wait(timeout=EXIT_TIMEOUT)}"
+    except subprocess.TimeoutExpired:
+        return "zen-lsp closed its stdout but is still running"
+
+
+_MUX = _Multiplexer()
 
 
 class LSPClient:
     """Simple LSP JSON-RPC client for testing"""
 
     def __init__(self):
-        lsp_path = "target/release/zen-lsp" if os.path.exists("target/release/zen-lsp") else "target/debug/zen-lsp"
-        if not os.path.exists(lsp_path):
-            raise RuntimeError(f"LSP not found. Run: cargo build")
-        self.proc = subprocess.Popen([lsp_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        self.req_id = 0
+        if LSP_PATH is None:
+            raise RuntimeError(f"zen-lsp not found under {TARGET_DIR}. Run: cargo build --release --bin zen-lsp")
+        stderr = open(STDERR_LOG, "ab") if STDERR_LOG else subprocess.PIPE
+        try:
+            # close_fds=False lets CPython start the server with posix_spawn (vfork)
+            # instead of fork+exec; nothing leaks, Python's own fds are non-inheritable
+            self.proc = subprocess.Popen([LSP_PATH], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+                                         bufsize=0, close_fds=False)
+        finally:
+            if STDERR_LOG:
+                stderr.close()
+        self._ids = itertools.count(1)
+        self._write_lock = threading.Lock()
+        # Held from a document's version bump through its write, so changes reach the server in version order
+        self._doc_lock = threading.Lock()
+        self._responses = {}
+        self._notifications = {}  # method -> pending messages, raw until a waiter first parses them
+        self._open_docs = {}  # uri -> text the server holds, to skip resending it
+        self._versions = {}  # uri -> version of that text
+        self._placeholders = set()  # uris whose didOpen placeholder diagnostics are still to be skipped
+        self._stdin = self.proc.stdin.fileno()
+        grow_pipe(self._stdin)  # large didOpen bodies and bursts fit without blocking the writer
+        self._stdout = self.proc.stdout.fileno()
+        grow_pipe(self._stdout)  # likewise for large responses (semantic tokens, symbols)
+        self._rx = bytearray()
+        self._need = 0  # buffer size the next frame needs before it is worth parsing
+        # The shared reader thread files incoming messages while the caller keeps sending
+        self._cv = threading.Condition()
+        self._error = None
+        self._closed = False
+        self._stderr = bytearray()
+        _MUX.register(self._stdout, self)
+        if self.proc.stderr:
+            _MUX.register(self.proc.stderr.fileno(), self._stderr)
+
+    def __enter__(self):
+        try:
+            self.init()
+        except BaseException:  # __exit__ will not run: stop the server here rather than leak it
+            self._closed = True
+            self.proc.kill()
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
 
     def request(self, method: str, params: dict) -> dict:
-        self.req_id += 1
-        self._send({"jsonrpc": "2.0", "id": self.req_id, "method": method, "params": params})
-        return self._recv(self.req_id)
+        return self._recv(self.submit(method, params))
+
+    def submit(self, method: str, params: dict) -> int:
+        """Send a request without waiting for its response; returns its id"""
+        msg_id = next(self._ids)
+        if DEBUG:
+            _trace("->", encode(method, params, msg_id))
+        with self._write_lock:
+            write_message(self._stdin, method, params, msg_id)
+        return msg_id
+
+    def collect(self, ids) -> dict:
+        """Wait for every id in ids; responses may arrive in any order"""
+        return {i: self._recv(i) for i in ids}
+
+    def request_many(self, calls) -> list:
+        """Pipeline (method, params) requests in a single write, then reap them.
+
+        Responses are returned in call order. zen-lsp does not accept JSON-RPC
+        batch arrays, so the requests go out as back-to-back frames instead.
+        """
+        ids, burst = [], bytearray()
+        for method, params in calls:
+            ids.append(next(self._ids))
+            burst += frame(encode(method, params, ids[-1]))
+        self._send_raw(burst)
+        responses = self.collect(ids)
+        return [responses[i] for i in ids]
+
+    def run_concurrent(self, jobs, max_workers: int = 8) -> list:
+        """Run each job(client) on a thread pool against this one server.
+
+        Requests from all jobs are in flight together and the reader thread
+        routes each response to its caller, so wall time approaches the
+        slowest job rather than the sum. Results are returned in job order.
+        """
+        from concurrent.futures import ThreadPoolExecutor  # imports logging; deferred to first use
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda job: job(self), jobs))
 
     def notify(self, method: str, params: dict):
-        self._send({"jsonrpc": "2.0", "method": method, "params": params})
+        if DEBUG:
+            _trace("->", encode(method, params))
+        with self._write_lock:
+            write_message(self._stdin, method, params)
 
-    def _send(self, msg: dict):
-        content = json.dumps(msg)
-        self.proc.stdin.write(f"Content-Length: {len(content)}\r\n\r\n{content}".encode())
-        self.proc.stdin.flush()
+    def _send_raw(self, data: bytes):
+        if DEBUG:
+            _trace("->", data)
+        with self._write_lock:
+            write_all(self._stdin, data)
 
     def _recv(self, expected_id: int) -> dict:
-        while True:
-            header = b""
-            while b"\r\n\r\n" not in header:
-                header += self.proc.stdout.read(1)
-            length = int([l for l in header.decode().split("\r\n") if "Content-Length" in l][0].split(":")[1])
-            resp = json.loads(self.proc.stdout.read(length))
-            if resp.get("id") == expected_id:
-                return resp
+        return loads(self._wait(lambda: self._responses.pop(expected_id, None)))
+
+    def wait_for_notification(self, method: str, predicate=None, timeout: float = None) -> dict:
+        """Block until the server sends `method` (with predicate(params) true, if given)
+        and return that message; earlier unrelated notifications stay queued.
+
+        Use this instead of sleeping for the server to react to a change.
+        """
+        def take():
+            # Rescanned from the start on every wake-up: other waiters may have
+            # removed earlier entries, so a saved cursor could skip a message
+            queue = self._notifications.get(method, ())
+            for i, msg in enumerate(queue):
+                if not isinstance(msg, dict):
+                    queue[i] = msg = loads(msg)  # parsed once, however many waiters look at it
+                if predicate is None or predicate(msg.get("params")):
+                    del queue[i]
+                    return msg
+            return None
+
+        return self._wait(take, timeout)
+
+    def _wait(self, take, timeout: float = None):
+        """Return take() once it yields a message; fail fast if the server dies or goes quiet.
+
+        take() runs under the lock each time the reader files a message, so it
+        both checks for and removes its message in one step.
+        """
+        timeout = READ_TIMEOUT if timeout is None else timeout
+        found = None
+
+        def ready():
+            nonlocal found
+            found = take()
+            return found is not None or self._error is not None
+
+        with self._cv:
+            if not self._cv.wait_for(ready, timeout):
+                raise TimeoutError(f"no reply from zen-lsp within {timeout}s")
+            if found is None:
+                raise self._error
+            return found
+
+    def _fail(self, error: Exception):
+        with self._cv:
+            self._error = error
+            self._cv.notify_all()
+
+    def _feed(self, chunk: bytes):
+        """Append stdout bytes (on the reader thread) and file every complete frame"""
+        rx = self._rx
+        # Only new bytes can complete a header terminator, unless a header is already pending
+        scan = 0 if self._need else max(len(rx) - 3, 0)
+        rx += chunk
+        while len(rx) >= self._need:
+            end = rx.find(b"\r\n\r\n", scan)
+            if end < 0:
+                return
+            stop = end + 4 + content_length(rx, end)
+            if len(rx) < stop:
+                self._need = stop
+                return
+            body = bytes(rx[end + 4:stop])
+            del rx[:stop]
+            self._need = scan = 0
+            self._file(body)
+
+    def _file(self, body: bytes):
+        """File a frame still encoded: responses by id, anything else in arrival order.
+
+        Parsing is left to whichever thread waits on the message, so the
+        shared reader thread only routes.
+        """
+        if DEBUG:
+            _trace("<-", body)
+        msg_id = response_id(body)
+        method = None if msg_id is not None else notification_method(body)
+        if msg_id is None and method is None:  # unusual envelope: parse to be sure
+            msg = loads(body)
+            if "method" in msg:
+                method, body = msg["method"], msg
+            else:
+                msg_id = msg.get("id")
+        with self._cv:
+            if msg_id is not None:
+                self._responses[msg_id] = body
+            elif method is not None:
+                queue = self._notifications.setdefault(method, [])
+                if not (queue and method in _SIGNALS):
+                    queue.append(body)
+            self._cv.notify_all()
 
     def init(self):
-        resp = self.request("initialize", {"processId": os.getpid(), "rootUri": f"file://{os.getcwd()}", "capabilities": {}})
-        self.notify("initialized", {})
+        resp = self.request("initialize", _INIT_PARAMS)
+        self._send_raw(INITIALIZED)
         return "result" in resp
 
     def shutdown(self):
-        self.request("shutdown", {})
-        self.notify("exit", {})
-        self.proc.wait()
+        """shutdown -> exit, then give the server a moment before killing it.
+
+        Safe to call more than once (explicitly and again from atexit, say):
+        later calls do nothing. After a crash only the reaping is left to do,
+        so the error that reported the crash is not replaced by a broken pipe.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._error is None:
+                self.request("shutdown", EMPTY)
+                self._send_raw(EXIT)
+        except BrokenPipeError:  # died after the check; the reader reports why
+            pass
+        finally:
+            self._release()
+
+    def _release(self):
+        """Reap the server, killing it if it lingers, and free its pipes"""
+        try:
+            self.proc.wait(timeout=EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        with self._cv:  # the reader unregisters the fd once it sees EOF
+            self._cv.wait_for(lambda: self._error is not None, EXIT_TIMEOUT)
+        _MUX.unregister(self._stdout)
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        if self.proc.stderr:
+            _MUX.unregister(self.proc.stderr.fileno())
+            self.proc.stderr.close()
+
+    def stderr_tail(self) -> str:
+        """The last STDERR_TAIL bytes the server wrote to stderr, for debugging a failure"""
+        return self._stderr.decode(errors="replace")
+
+    def open(self, uri: str, content: str) -> bool:
+        """Make the server hold content for uri: didOpen the first time, a
+        whole-text didChange if it holds other text, nothing if it holds this.
+
+        Returns whether anything was sent (and so whether diagnostics follow).
+        Diagnostics still queued for uri are dropped first, but zen-lsp
+        publishes without a version, so one for the old text that arrives
+        after the change is sent is still taken for the new text's.
+        """
+        with self._doc_lock:
+            body = self._sync(uri, content)
+            if body is None:
+                return False
+            self._send_raw(frame(body))
+        return True
+
+    def open_many(self, docs) -> dict:
+        """Open (uri, content) documents in one write and wait until all are analysed.
+
+        The server analyses them back to back instead of one round trip at a
+        time. Returns diagnostics keyed by uri for the documents that were
+        sent; ones already open with the same text are skipped. A uri given
+        more than once is sent once, with its last content, so there is one
+        result to wait for.
+        """
+        latest = dict(docs)
+        with self._doc_lock:
+            sent = [(uri, body) for uri, body in ((uri, self._sync(uri, content)) for uri, content in latest.items())
+                    if body is not None]
+            self._send_raw(b"".join(frame(body) for _, body in sent))
+        return {uri: self.diagnostics(uri) for uri, _ in sent}
+
+    def _sync(self, uri: str, content: str):
+        """Encoded notification bringing the server's copy of uri to content, or None if it has it.
+
+        The caller holds _doc_lock until the notification is written.
+        """
+        held = self._open_docs.get(uri)
+        if held == content:
+            return None
+        self._drop_diagnostics(uri)
+        self._open_docs[uri] = content
+        if held is None:
+            self._versions[uri] = 1
+            with self._cv:
+                self._placeholders.add(uri)
+            return encode("textDocument/didOpen", _did_open_params(uri, content))
+        self._versions[uri] += 1
+        return encode("textDocument/didChange", {"textDocument": {"uri": uri, "version": self._versions[uri]},
+                                                 "contentChanges": [{"text": content}]})
+
+    def edit(self, uri: str, start: tuple, end: tuple, text: str):
+        """Replace the (line, char) range start..end of an open document with text.
+
+        Only the edit travels as a ranged didChange, rather than the whole
+        document again; diagnostics for the result follow, with the same
+        caveat about late ones for the old text as for open().
+        """
+        with self._doc_lock:
+            self._drop_diagnostics(uri)
+            content = self._open_docs[uri]
+            content = content[:_offset(content, *start)] + text + content[_offset(content, *end):]
+            self._open_docs[uri] = content
+            self._versions[uri] += 1
+            self.notify("textDocument/didChange", {
+                "textDocument": {"uri": uri, "version": self._versions[uri]},
+                "contentChanges": [{"range": {"start": {"line": start[0], "character": start[1]},
+                                              "end": {"line": end[0], "character": end[1]}},
+                                    "text": text}]})
+
+    def diagnostics(self, uri: str, timeout: float = None) -> list:
+        """Wait for the diagnostics zen-lsp publishes for the text last sent for uri.
+
+        On didOpen the server first publishes an empty placeholder, and the
+        background analysis follows later; the placeholder is skipped here.
+        The analysis is only published for a document that parses, so for
+        one that does not this waits out the timeout. On didChange the
+        server's quick check is published at once, and that is returned.
+        """
+        with self._cv:
+            placeholder = uri in self._placeholders
+            self._placeholders.discard(uri)
+        if placeholder:
+            self._next_diagnostics(uri)
+        return self._next_diagnostics(uri, timeout)["params"]["diagnostics"]
+
+    def _next_diagnostics(self, uri: str, timeout: float = None) -> dict:
+        return self.wait_for_notification("textDocument/publishDiagnostics", lambda p: p["uri"] == uri, timeout)
+
+    def close(self, uri: str):
+        """didClose, dropping any diagnostics for uri that nobody waited for.
 
-    def open(self, uri: str, content: str):
-        self.notify("textDocument/didOpen", {"textDocument": {"uri": uri, "languageId": "zen", "version": 1, "text": content}})
+        zen-lsp ignores didClose and keeps the document; diagnostics it
+        publishes for uri after this stay queued.
+        """
+        with self._doc_lock:
+            self._open_docs.pop(uri, None)
+            self._versions.pop(uri, None)
+            self._drop_diagnostics(uri)
+            with self._cv:
+                self._placeholders.discard(uri)
+            self.notify("textDocument/didClose", {"textDocument": {"uri": uri}})
+
+    def _drop_diagnostics(self, uri: str):
+        """Forget diagnostics for uri that are queued but unread.
+
+        The didOpen placeholder is always the first publish for a uri, so
+        once any has arrived the placeholder no longer needs skipping.
+        """
+        with self._cv:
+            queue = self._notifications.get("textDocument/publishDiagnostics")
+            if not queue:
+                return
+            kept = [m for m in (m if isinstance(m, dict) else loads(m) for m in queue) if m["params"]["uri"] != uri]
+            if len(kept) < len(queue):
+                self._placeholders.discard(uri)
+            queue[:] = kept
+
+    def open_file(self, path: str) -> str:
+        """Open a file from disk under its real URI; returns the URI"""
+        uri, content = document(path)
+        self.open(uri, content)
+        return uri
+
+    def open_fixture(self, name: str = "sample.zen") -> str:
+        """Open a shared fixture under its real on-disk URI; returns the URI"""
+        return self.open_file(os.path.join(FIXTURES, name))
 
     def hover(self, uri: str, line: int, char: int):
         return self.request("textDocument/hover", {"textDocument": {"uri": uri}, "position": {"line": line, "character": char}}).get("result")
 
+    def hover_many(self, uri: str, positions) -> list:
+        """hover() at each (line, char), pipelined in one write; results in position order"""
+        return self._positional_many("textDocument/hover", uri, positions)
+
+    def definition_many(self, uri: str, positions) -> list:
+        """definition() at each (line, char), pipelined in one write; results in position order"""
+        return self._positional_many("textDocument/definition", uri, positions)
+
+    def _positional_many(self, method: str, uri: str, positions) -> list:
+        doc = {"uri": uri}
+        calls = [(method, {"textDocument": doc, "position": {"line": line, "character": char}}) for line, char in positions]
+        return [r.get("result") for r in self.request_many(calls)]
+
     def completion(self, uri: str, line: int, char: int):
         r = self.request("textDocument/completion", {"textDocument": {"uri": uri}, "position": {"line": line, "character": char}}).get("result")
         return r.get("items", []) if isinstance(r, dict) else r or []
@@ -64,12 +637,39 @@ class LSPClient:
     def symbols(self, uri: str):
         return self.request("textDocument/documentSymbol", {"textDocument": {"uri": uri}}).get("result") or []
 
+    def workspace_symbols(self, query: str):
+        return self.request("workspace/symbol", {"query": query}).get("result") or []
+
     def signature(self, uri: str, line: int, char: int):
         return self.request("textDocument/signatureHelp", {"textDocument": {"uri": uri}, "position": {"line": line, "character": char}}).get("result")
 
     def references(self, uri: str, line: int, char: int):
         return self.request("textDocument/references", {"textDocument": {"uri": uri}, "position": {"line": line, "character": char}, "context": {"includeDeclaration": True}}).get("result") or []
 
+    def inlay_hints(self, uri: str):
+        # Ask for exactly the lines the document has, so the server walks nothing extra;
+        # for a document this client did not open, the length is unknown, so ask for everything
+        text = self._open_docs.get(uri)
+        lines = text.count("\n") + 1 if text is not None else 2**31 - 1
+        r = self.request("textDocument/inlayHint", {"textDocument": {"uri": uri}, "range": {"start": {"line": 0, "character": 0}, "end": {"line": lines, "character": 0}}}).get("result")
+        return r or []
+
+    def code_lens(self, uri: str) -> list:
+        return self.request("textDocument/codeLens", {"textDocument": {"uri": uri}}).get("result") or []
+
+    def semantic_tokens(self, uri: str) -> list:
+        r = self.request("textDocument/semanticTokens/full", {"textDocument": {"uri": uri}}).get("result")
+        return r.get("data", []) if r else []
+
+    @staticmethod
+    def token_columns(data: list) -> tuple:
+        """Split flat semantic-token data into (deltaLine, deltaStart, length, tokenType, modifiers) columns.
+
+        Each column is one strided slice, so checks over a whole column
+        (e.g. max(types) < len(legend)) never unpack tokens one at a time.
+        """
+        return tuple(data[i::5] for i in range(5))
+
     @staticmethod
     def hover_text(hover) -> str:
         """Extract text from hover response"""
@@ -83,3 +683,56 @@ class LSPClient:
         if isinstance(contents, list):
             return " ".join(c.get("value", c) if isinstance(c, dict) else c for c in contents)
         return ""
+
+    @staticmethod
+    def completion_labels(items) -> set:
+        """Labels of completion items, built once so membership checks are O(1)"""
+        return {item["label"] for item in items or ()}
+
+    @staticmethod
+    def lens_commands(lenses) -> list:
+        """(command, function name) per code lens, e.g. ("zen.runTest", "test_add")"""
+        return [(l["command"]["command"], l["command"]["arguments"][1]) for l in lenses if l.get("command")]
+
+    @staticmethod
+    def hint_labels(hints) -> list:
+        """Label text of each inlay hint, so checks look at labels rather than str(hints).
+
+        A label is either a string or a list of parts, whose values are joined.
+        """
+        return [h["label"] if isinstance(h["label"], str) else "".join(p["value"] for p in h["label"])
+                for h in hints or ()]
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared() -> LSPClient:
+    """One initialized server reused by every test in this process, shut down at exit.
+
+    Tests sharing it should open documents under their own URIs. Closing
+    them only tidies the client: zen-lsp ignores didClose, so every
+    document opened stays on the server until it exits.
+    """
+    global _shared
+    with _shared_lock:  # two threads asking at once must not start two servers
+        if _shared is None:
+            _shared = LSPClient().__enter__()
+            atexit.register(_shared.shutdown)
+        return _shared
+
+
+def run_parallel(jobs, max_workers: int = 4) -> list:
+    """Run each job(client) against its own LSP instance, concurrently.
+
+    Jobs share no server state, so wall time approaches the slowest job
+    rather than the sum. Results are returned in job order.
+    """
+    def run(job):
+        with LSPClient() as client:
+            return job(client)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, jobs))
@@ -0,0 +1,62 @@
+"""pytest fixtures for the Python LSP tests"""
+
+import hashlib
+import os
+import tempfile
+
+import pytest
+
+import client
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_server.py")
+
+
+@pytest.fixture(scope="session")
+def lsp_client():
+    """The process-wide initialized zen-lsp (client.shared), so the server
+    starts once per session. It is shut down at session teardown, where
+    pytest still reports a failing shutdown. Unless ZEN_LSP names a binary,
+    the server is rebuilt first if it is missing or older than the sources.
+
+    Tests should open documents under their own URIs so they do not
+    overwrite each other's. zen-lsp ignores didClose, so every document
+    opened stays on the server for the session, and workspace-wide
+    results such as workspace_symbols include them all.
+    """
+    if "ZEN_LSP" not in os.environ and client.needs_build():
+        client.build()
+    server = client.shared()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def lsp_document(lsp_client, request):
+    """sample.zen opened on the shared server under a URI of this test's own.
+
+    The document only exists in the server's memory, at a path under the
+    temp dir named after a hash of the test id, so parametrized ids cannot
+    produce odd paths. Its analysed diagnostics are awaited (and consumed)
+    here. It is closed at teardown, but that only tidies the client: zen-lsp
+    ignores didClose, so the server keeps the document, and diagnostics
+    for it still in flight then are left queued.
+    """
+    name = hashlib.sha1(request.node.nodeid.encode()).hexdigest()[:16]
+    uri = client.uri_of(os.path.join(tempfile.gettempdir(), f"zen-lsp-{name}.zen"))
+    if lsp_client.open(uri, client.fixture("sample.zen")[1]):
+        lsp_client.diagnostics(uri)
+    yield uri
+    lsp_client.close(uri)
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """Start clients made in this test on mock_server.py rather than zen-lsp, so no build is needed"""
+    monkeypatch.setattr(client, "LSP_PATH", MOCK_SERVER)
+
+
+@pytest.fixture
+def mock_client(mock_server):
+    """An initialized client on a mock server of its own, shut down at teardown"""
+    with client.LSPClient() as c:
+        yield c
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""A stand-in for zen-lsp, so client tests run without a cargo build.
+
+It publishes in zen-lsp's order: didOpen gets an empty placeholder, then
+the background analysis; didChange gets the quick check at once (the
+background pass is debounced, so fast tests never see it). Each
+diagnostic's message is the text it was computed from, so a stale
+result is told apart from a fresh one.
+
+mock/document returns the server's copy of a document and every version
+it was sent. The mock/crash notification exits at once with code 3, and
+mock/linger makes it ignore exit, as a hung server would.
+"""
+
+import json
+import sys
+
+
+def offset(text, line, char):
+    """zen-lsp's position_to_byte_offset: a position past its line's end clamps to end of file"""
+    at_line = at_char = 0
+    for i, ch in enumerate(text):
+        if (at_line, at_char) == (line, char):
+            return i
+        at_line, at_char = (at_line + 1, 0) if ch == "\n" else (at_line, at_char + 1)
+    return len(text)
+
+
+def read():
+    length = None
+    for line in iter(sys.stdin.buffer.readline, b"\r\n"):
+        if not line:
+            return None
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    return json.loads(sys.stdin.buffer.read(length))
+
+
+def send(**msg):
+    body = json.dumps({"jsonrpc": "2.0", **msg}).encode()
+    sys.stdout.buffer.write(b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+    sys.stdout.buffer.flush()
+
+
+def publish(uri, text=None):
+    diagnostics = [] if text is None else [{"range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}},
+                                            "message": text}]
+    send(method="textDocument/publishDiagnostics", params={"uri": uri, "diagnostics": diagnostics})
+    send(method="workspace/semanticTokens/refresh", params=None)
+
+
+def main():
+    docs, versions, linger = {}, {}, False
+    while (msg := read()) is not None:
+        method, params = msg.get("method"), msg.get("params") or {}
+        if method == "textDocument/didOpen":
+            doc = params["textDocument"]
+            docs[doc["uri"]], versions[doc["uri"]] = doc["text"], [doc["version"]]
+            publish(doc["uri"])
+            publish(doc["uri"], doc["text"])
+        elif method == "textDocument/didChange":  # like zen-lsp, a document it never opened starts empty
+            uri, text = params["textDocument"]["uri"], docs.get(params["textDocument"]["uri"], "")
+            for change in params["contentChanges"]:
+                if "range" in change:
+                    start, end = (offset(text, p["line"], p["character"]) for p in change["range"].values())
+                    start, end = sorted((start, end))
+                    text = text[:start] + change["text"] + text[end:]
+                else:
+                    text = change["text"]
+            docs[uri] = text
+            versions.setdefault(uri, []).append(params["textDocument"]["version"])
+            publish(uri, text)
+        elif method == "mock/crash":
+            sys.exit(3)
+        elif method == "mock/linger":
+            linger = True
+        elif method == "exit" and not linger:
+            sys.exit(0)
+        elif "id" in msg and method is not None:
+            if method == "initialize":
+                result = {"capabilities": {}}
+            elif method == "mock/document":
+                uri = params["uri"]
+                result = {"text": docs.get(uri), "versions": versions.get(uri, [])}
+            else:
+                result = None
+            send(id=msg["id"], result=result)
+
+
+if __name__ == "__main__":
+    main()
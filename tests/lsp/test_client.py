@@ -0,0 +1,138 @@
+"""LSPClient checks that need no zen-lsp: pure helpers, and behaviour against mock_server.py"""
+
+import signal
+import threading
+import time
+
+import pytest
+
+import client
+import mock_server
+
+
+def test_one_reader_thread_serves_every_client(mock_server):
+    threads = threading.active_count()
+    clients = [client.LSPClient().__enter__() for _ in range(3)]
+    try:
+        assert threading.active_count() <= threads + 1
+        ids = [c.submit("mock/document", {"uri": "file:///a.zen"}) for c in clients]
+        clients.pop().shutdown()  # the reader keeps serving the others after one closes
+        for c, i in zip(clients, ids):
+            assert c.collect([i])[i]["result"] == {"text": None, "versions": []}
+    finally:
+        for c in clients:
+            c.shutdown()
+
+
+def test_shutdown_after_a_crash_keeps_the_crash_error(mock_server):
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        with client.LSPClient() as c:
+            c.notify("mock/crash", {})
+            c.request("mock/document", {"uri": "file:///a.zen"})
+    assert c.proc.returncode == 3
+    c.shutdown()  # and again, as atexit would
+
+
+def test_a_waiter_fails_fast_when_the_server_dies(mock_client):
+    threading.Timer(0.05, mock_client.notify, ("mock/crash", {})).start()
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        mock_client.wait_for_notification("window/showMessage")
+    assert time.monotonic() - started < client.READ_TIMEOUT / 2
+
+
+def test_a_quiet_server_times_out(mock_client):
+    with pytest.raises(TimeoutError):
+        mock_client.wait_for_notification("window/showMessage", timeout=0.05)
+
+
+def test_diagnostics_after_open_skip_the_placeholder(mock_client):
+    assert mock_client.open("file:///a.zen", "main")
+    assert [d["message"] for d in mock_client.diagnostics("file:///a.zen")] == ["main"]
+
+
+def test_concurrent_edits_reach_the_server_in_version_order(mock_client):
+    uri = "file:///a.zen"
+    mock_client.open(uri, "main")
+    mock_client.run_concurrent([lambda c: c.edit(uri, (0, 0), (0, 0), "x")] * 64, max_workers=16)
+    server = mock_client.request("mock/document", {"uri": uri})["result"]
+    assert server == {"text": "x" * 64 + "main", "versions": list(range(1, 66))}
+
+
+def test_diagnostics_after_a_change_are_for_the_new_text(mock_client):
+    uri = "file:///a.zen"
+    mock_client.open(uri, "main")
+    mock_client.request("mock/document", {"uri": uri})  # every publish for the open has now arrived
+    mock_client.edit(uri, (0, 4), (0, 4), "()")
+    assert [d["message"] for d in mock_client.diagnostics(uri)] == ["main()"]
+    mock_client.edit(uri, (0, 0), (0, 0), "x")
+    mock_client.request("mock/document", {"uri": uri})
+    mock_client.open(uri, "other")
+    assert [d["message"] for d in mock_client.diagnostics(uri)] == ["other"]
+
+
+def test_offset_clamps_past_a_line_end_to_the_end_like_the_server():
+    text = "ab\ncd\n\nef"
+    assert client._offset(text, 0, 2) == 2  # the line's own newline
+    assert client._offset(text, 0, 3) == len(text)  # past it: not into the next line
+    assert client._offset(text, 2, 0) == 6
+    assert client._offset(text, 3, 2) == len(text)
+    assert client._offset(text, 9, 0) == len(text)
+    for line in range(6):
+        for char in range(5):
+            assert client._offset(text, line, char) == mock_server.offset(text, line, char)
+
+
+def test_an_edit_past_a_line_end_leaves_both_copies_equal(mock_client):
+    uri = "file:///a.zen"
+    mock_client.open(uri, "ab\ncd\n")
+    mock_client.edit(uri, (0, 1), (0, 9), "X")
+    held = mock_client.request("mock/document", {"uri": uri})["result"]["text"]
+    assert held == "aX"
+    assert not mock_client.open(uri, held)  # the client's copy agrees, so nothing is resent
+
+
+def test_open_many_sends_a_repeated_uri_once_with_its_last_text(mock_client):
+    a, b = "file:///a.zen", "file:///b.zen"
+    result = mock_client.open_many([(a, "one"), (b, "b"), (a, "two")])
+    assert {uri: [d["message"] for d in diags] for uri, diags in result.items()} == {a: ["two"], b: ["b"]}
+    assert mock_client.request("mock/document", {"uri": a})["result"] == {"text": "two", "versions": [1]}
+
+
+def test_reopening_with_new_text_sends_the_next_version(mock_client):
+    uri = "file:///a.zen"
+    assert mock_client.open(uri, "one") and mock_client.open(uri, "two")
+    mock_client.edit(uri, (0, 3), (0, 3), "!")
+    assert mock_client.request("mock/document", {"uri": uri})["result"] == {"text": "two!", "versions": [1, 2, 3]}
+
+
+def test_reopening_with_the_same_text_sends_nothing(mock_client):
+    uri = "file:///a.zen"
+    assert mock_client.open(uri, "main")
+    assert not mock_client.open(uri, "main")
+    assert mock_client.open_many([(uri, "main")]) == {}
+    assert mock_client.request("mock/document", {"uri": uri})["result"]["versions"] == [1]
+
+
+def test_token_columns_split_flat_token_data():
+    data = [0, 4, 3, 1, 0, 2, 0, 5, 7, 1]
+    assert client.LSPClient.token_columns(data) == ([0, 2], [4, 0], [3, 5], [1, 7], [0, 1])
+    assert client.LSPClient.token_columns([]) == ([],) * 5
+
+
+def test_hint_labels_join_label_parts():
+    hints = [{"label": ": i32"}, {"label": [{"value": "x"}, {"value": ": "}, {"value": "f64"}]}]
+    assert client.LSPClient.hint_labels(hints) == [": i32", "x: f64"]
+    assert client.LSPClient.hint_labels(None) == []
+
+
+def test_lens_commands_skip_lenses_without_a_command():
+    lenses = [{"command": {"command": "zen.runTest", "arguments": ["file:///a.zen", "test_add"]}}, {"range": {}}]
+    assert client.LSPClient.lens_commands(lenses) == [("zen.runTest", "test_add")]
+
+
+def test_shutdown_kills_a_server_that_ignores_exit(mock_client, monkeypatch):
+    monkeypatch.setattr(client, "EXIT_TIMEOUT", 0.1)
+    mock_client.notify("mock/linger", {})
+    mock_client.shutdown()
+    assert mock_client.proc.returncode == -signal.SIGKILL
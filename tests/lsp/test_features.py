@@ -0,0 +1,6 @@
+"""Feature checks against a live zen-lsp, through the shared session server"""
+
+
+def test_document_symbols(lsp_client, lsp_document):
+    names = {s["name"] for s in lsp_client.symbols(lsp_document)}
+    assert {"add", "divide", "main"} <= names
@@ -0,0 +1,103 @@
+"""Framing and routing checks, fed by hand to a client whose mock server stays idle"""
+
+import pytest
+
+from _frame import content_length, encode, frame, loads, notification_method, response_id
+from client import LSPClient
+
+
+@pytest.fixture
+def receiver(mock_server):
+    """A client whose mock server is never initialized, so it sends nothing and frames are fed by hand"""
+    c = LSPClient()
+    yield c
+    c.shutdown()
+
+
+RESPONSE = b'{"jsonrpc":"2.0","id":7,"result":{"contents":"x"}}'
+NOTIFICATION = b'{"jsonrpc":"2.0","method":"textDocument/publishDiagnostics","params":{"uri":"file:///a.zen","diagnostics":[]}}'
+SERVER_REQUEST = b'{"jsonrpc":"2.0","id":1,"method":"client/registerCapability","params":{}}'
+
+
+def test_header_split_across_chunks(receiver):
+    c = receiver
+    for i in range(len(frame(RESPONSE))):
+        c._feed(frame(RESPONSE)[i:i + 1])
+    assert c._responses == {7: RESPONSE}
+    assert not c._rx
+
+
+def test_several_frames_in_one_chunk(receiver):
+    c = receiver
+    c._feed(frame(RESPONSE) + frame(NOTIFICATION) + frame(RESPONSE.replace(b'"id":7', b'"id":8')))
+    assert sorted(c._responses) == [7, 8]
+    assert c._notifications["textDocument/publishDiagnostics"] == [NOTIFICATION]
+
+
+def test_partial_body_waits_for_the_rest(receiver):
+    c = receiver
+    data = frame(RESPONSE)
+    c._feed(data[:-10])
+    assert not c._responses
+    assert c._need == len(data)
+    c._feed(data[-10:])
+    assert c._responses == {7: RESPONSE}
+    assert c._need == 0
+
+
+def test_id_inside_a_string_does_not_make_a_response(receiver):
+    c = receiver
+    log = b'{"jsonrpc":"2.0","method":"window/logMessage","params":{"type":3,"message":"\\"id\\": 5"}}'
+    c._feed(frame(log))
+    assert not c._responses
+    assert c._notifications["window/logMessage"] == [log]
+
+
+def test_method_inside_a_result_does_not_make_a_notification(receiver):
+    c = receiver
+    body = b'{"jsonrpc":"2.0","id":3,"result":[{"label":"method"}]}'
+    c._feed(frame(body))
+    assert c._responses == {3: body}
+
+
+def test_server_request_is_queued_by_method(receiver):
+    c = receiver
+    c._feed(frame(SERVER_REQUEST))
+    assert not c._responses
+    assert c.wait_for_notification("client/registerCapability", timeout=0)["id"] == 1
+
+
+def test_unusual_envelope_falls_back_to_parsing(receiver):
+    c = receiver
+    c._feed(frame(b'{"result": null, "id": 4}'))
+    assert list(c._responses) == [4]
+
+
+def test_content_length_rejects_a_header_without_it():
+    buf = bytearray(b"Content-Type: application/json\r\n\r\n{}")
+    with pytest.raises(ValueError):
+        content_length(buf, buf.find(b"\r\n\r\n"))
+
+
+def test_content_length_finds_a_later_header():
+    buf = bytearray(b"Content-Type: x\r\nContent-Length: 12\r\n\r\n")
+    assert content_length(buf, buf.find(b"\r\n\r\n")) == 12
+
+
+def test_response_id_recognises_only_responses():
+    assert response_id(RESPONSE) == 7
+    assert response_id(b'{"jsonrpc": "2.0", "id": 9, "error": {"code": -32601}}') == 9
+    assert response_id(SERVER_REQUEST) is None
+    assert response_id(NOTIFICATION) is None
+
+
+def test_notification_method_recognises_only_notifications():
+    assert notification_method(NOTIFICATION) == "textDocument/publishDiagnostics"
+    assert notification_method(RESPONSE) is None
+    assert notification_method(SERVER_REQUEST) is None
+
+
+def test_encode_round_trips():
+    assert loads(encode("textDocument/hover", {"a": "é"}, 2)) == {
+        "jsonrpc": "2.0", "id": 2, "method": "textDocument/hover", "params": {"a": "é"}}
+    assert "id" not in loads(encode("initialized", b"{}"))